@@ -1,23 +1,40 @@
 import os
 import time
 import json 
-import math
 import asyncio
 import logging
+import atexit
+import contextlib
 import base64
+import hashlib
+import hmac
 import aiofiles
 import requests
-from functools import wraps
+from collections import OrderedDict
+from functools import partial, wraps
 from urllib.parse import quote
-from threading import Thread
+from threading import Lock, Thread
 from concurrent.futures import ThreadPoolExecutor
 import multiprocessing
 
+import psutil
+
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from pyrogram import Client, filters
+from pyrogram.enums import ChatAction
+from pyrogram.errors import FloodWait
 from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
 from flask import Flask, render_template, request, jsonify, send_file
+from waitress import serve
+
+# uvloop must be installed before the Client is built, since Pyrogram binds its loop at construction
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:  # Not available on Windows
+    uvloop = None
 
 # Import configuration
 from config import config
@@ -39,11 +56,32 @@ ADMIN_ID = config.ADMIN_ID
 # GPLinks.in Configuration
 GPLINKS_API_KEY = getattr(config, 'GPLINKS_API_KEY', '')  # Add your GPLinks API key to config
 GPLINKS_API_URL = "https://gplinks.in/api"
+GPLINKS_REQUEST_PREFIX = f"{GPLINKS_API_URL}?api={GPLINKS_API_KEY}&url="  # Only the target URL varies
 AUTO_SHORTEN = getattr(config, 'AUTO_SHORTEN', True)  # Enable/disable auto shortening
 
 # Player URL configuration
 RENDER_URL = os.getenv("RENDER_URL", "http://localhost:8000")
-SUPPORTED_VIDEO_FORMATS = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.3gp', '.mpeg', '.mpg'}
+PRESIGNED_URL_EXPIRY = 604800  # 7 days
+# Signs player links so they stay valid across restarts; derived from the Wasabi secret unless set
+PLAYER_LINK_SECRET = (
+    os.getenv("PLAYER_LINK_SECRET", "").encode()
+    or hashlib.sha256(b"player-link:" + WASABI_SECRET_KEY.encode()).digest()
+)
+SUPPORTED_VIDEO_FORMATS = frozenset({'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.3gp', '.mpeg', '.mpg'})
+
+# Content types for common uploads, so objects are served with a usable MIME type
+CONTENT_TYPES = {
+    '.mp4': 'video/mp4', '.m4v': 'video/mp4', '.mkv': 'video/x-matroska', '.webm': 'video/webm',
+    '.avi': 'video/x-msvideo', '.mov': 'video/quicktime', '.wmv': 'video/x-ms-wmv', '.flv': 'video/x-flv',
+    '.3gp': 'video/3gpp', '.mpeg': 'video/mpeg', '.mpg': 'video/mpeg',
+    '.mp3': 'audio/mpeg', '.m4a': 'audio/mp4', '.ogg': 'audio/ogg', '.flac': 'audio/flac', '.wav': 'audio/wav',
+    '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif',
+    '.pdf': 'application/pdf', '.zip': 'application/zip', '.apk': 'application/vnd.android.package-archive',
+}
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+# Extension -> player file type; anything not listed is 'other'
+FILE_TYPES = dict.fromkeys(SUPPORTED_VIDEO_FORMATS, 'video')
 
 # In-memory storage for authorized user IDs
 ALLOWED_USERS = {ADMIN_ID}
@@ -52,22 +90,69 @@ ALLOWED_USERS = {ADMIN_ID}
 CHUNK_SIZE = 16 * 1024 * 1024  # 16MB chunks for parallel upload
 MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)  # Optimal thread count
 BUFFER_SIZE = 256 * 1024  # 256KB buffer for file operations
+MAX_TRANSMISSIONS = 8  # Concurrent Telegram transfers per client (Pyrogram default is 1)
+TMPFS_DIR = "/dev/shm"  # RAM-backed scratch space for local files when memory allows
+
+# boto3 managed transfer settings for file-object uploads
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=CHUNK_SIZE,
+    max_concurrency=MAX_WORKERS,
+    use_threads=True
+)
+
+# Pipe uploads can't seek, so boto3 buffers each part in memory before sending it. Per stream
+# that is at most max_in_memory_upload_chunks * multipart_chunksize = 4 * 8MB = 32MB, so
+# MAX_TRANSMISSIONS concurrent streams hold roughly 256MB in total
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+STREAM_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=STREAM_CHUNK_SIZE,
+    multipart_chunksize=STREAM_CHUNK_SIZE,
+    max_concurrency=4,
+    max_in_memory_upload_chunks=4,
+    use_threads=True
+)
 
 # Thread pool for parallel operations
-thread_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+thread_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='wasabi')
+atexit.register(thread_pool.shutdown, wait=False)
+
+# Each streamed upload parks one thread in upload_fileobj until its pipe hits EOF, and its pipe
+# writes block until boto3 frees a part buffer. Both run on stream_pool, which has a reader and a
+# writer thread for each of the MAX_TRANSMISSIONS streams stream_slots admits, so streams always
+# make progress and never hold thread_pool threads that presign/delete/shortener calls need
+stream_pool = ThreadPoolExecutor(max_workers=2 * MAX_TRANSMISSIONS, thread_name_prefix='stream')
+atexit.register(stream_pool.shutdown, wait=False)
+stream_slots = asyncio.Semaphore(MAX_TRANSMISSIONS)
+
+# Shared HTTP session so shortener calls reuse pooled keep-alive connections
+http_session = requests.Session()
+http_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS))
 
 # --- GPLinks.in Shortener Functions ---
+# Long URL -> short URL, least recently used first; presigned URLs are reused per key,
+# so refresh and copy clicks for the same file hit this instead of the API
+shortened_cache = OrderedDict()
+SHORTENED_CACHE_SIZE = 1024
+
 async def shorten_url_gplinks(long_url):
     """Shorten URL using GPLinks.in API"""
     if not GPLINKS_API_KEY or not AUTO_SHORTEN:
         return long_url  # Return original if shortening is disabled
     
+    cached = shortened_cache.get(long_url)
+    if cached:
+        shortened_cache.move_to_end(long_url)
+        return cached
+    
     try:
         # GPLinks API endpoint
-        api_url = f"{GPLINKS_API_URL}?api={GPLINKS_API_KEY}&url={quote(long_url)}"
+        api_url = GPLINKS_REQUEST_PREFIX + quote(long_url)
         
-        # Make API request
-        response = requests.get(api_url, timeout=10)
+        # Make API request on the worker pool; requests blocks for up to the full timeout
+        response = await asyncio.get_running_loop().run_in_executor(
+            thread_pool, partial(http_session.get, api_url, timeout=10)
+        )
         
         if response.status_code == 200:
             data = response.json()
@@ -75,6 +160,9 @@ async def shorten_url_gplinks(long_url):
                 shortened_url = data.get('shortenedUrl')
                 if shortened_url:
                     logger.info(f"✅ URL shortened: {long_url} -> {shortened_url}")
+                    shortened_cache[long_url] = shortened_url
+                    if len(shortened_cache) > SHORTENED_CACHE_SIZE:
+                        shortened_cache.popitem(last=False)
                     return shortened_url
             else:
                 logger.warning(f"GPLinks API error: {data.get('message', 'Unknown error')}")
@@ -89,9 +177,11 @@ async def shorten_url_gplinks(long_url):
 
 async def shorten_all_urls(direct_url, player_url):
     """Shorten both direct and player URLs"""
-    shortened_direct = await shorten_url_gplinks(direct_url) if direct_url else None
-    shortened_player = await shorten_url_gplinks(player_url) if player_url else None
+    async def _shorten(url):
+        return await shorten_url_gplinks(url) if url else None
     
+    # Both links go out over the pooled session at once
+    shortened_direct, shortened_player = await asyncio.gather(_shorten(direct_url), _shorten(player_url))
     return shortened_direct, shortened_player
 
 # --- Callback Data Management ---
@@ -99,16 +189,20 @@ class CallbackData:
     """Manage callback data to avoid exceeding 64-byte limit"""
     def __init__(self):
         self.file_map = {}  # Maps short IDs to full filenames
+        self.link_map = {}  # Maps short IDs to the (direct, player) URLs shown on the buttons
         self.next_id = 1
     
-    def store_file(self, filename):
-        """Store filename and return short callback ID"""
+    def store_file(self, filename, links=None):
+        """Store filename (and optionally its links) and return short callback ID"""
         short_id = str(self.next_id)
         self.file_map[short_id] = filename
+        if links:
+            self.link_map[short_id] = links
         self.next_id += 1
         # Simple cleanup to prevent memory leaks
         if len(self.file_map) > 1000:
             self.file_map.clear()
+            self.link_map.clear()
             self.next_id = 1
         return short_id
     
@@ -116,18 +210,32 @@ class CallbackData:
         """Get filename from short ID"""
         return self.file_map.get(short_id)
     
+    def get_links(self, short_id):
+        """Get the cached (direct, player) URLs for a short ID, if any"""
+        return self.link_map.get(short_id)
+    
     def clear_file(self, short_id):
         """Remove mapping when no longer needed"""
         if short_id in self.file_map:
             del self.file_map[short_id]
+        self.link_map.pop(short_id, None)
 
 # Global callback data manager
 callback_data = CallbackData()
 
 # --- Bot & Wasabi Client Initialization ---
-app = Client("wasabi_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+app = Client(
+    "wasabi_bot",
+    api_id=API_ID,
+    api_hash=API_HASH,
+    bot_token=BOT_TOKEN,
+    max_concurrent_transmissions=MAX_TRANSMISSIONS,
+    sleep_threshold=60  # Wait out FloodWaits up to a minute instead of failing the handler
+)
 
 # Optimized Boto3 S3 client for Wasabi
+# One session and one client are shared by every thread; boto3 clients are thread-safe,
+# so keeping a single instance keeps its connection pool (and TLS sessions) warm
 try:
     session = boto3.Session(
         aws_access_key_id=WASABI_ACCESS_KEY,
@@ -139,7 +247,14 @@ try:
         's3',
         endpoint_url=f'https://s3.{WASABI_REGION}.wasabisys.com',
         config=boto3.session.Config(
-            max_pool_connections=MAX_WORKERS,
+            # One connection per thread that can hit S3 at once: every admitted stream's transfer
+            # threads, a local-file upload's transfer threads, and the worker pool
+            max_pool_connections=(
+                MAX_TRANSMISSIONS * STREAM_TRANSFER_CONFIG.max_concurrency
+                + TRANSFER_CONFIG.max_concurrency
+                + MAX_WORKERS
+            ),
+            tcp_keepalive=True,
             retries={'max_attempts': 5, 'mode': 'adaptive'},
             s3={'addressing_style': 'virtual', 'payload_signing_enabled': False},
             read_timeout=300,
@@ -154,6 +269,10 @@ except Exception as e:
     logger.error(f"❌ Failed to connect to Wasabi: {e}")
     s3_client = None
 
+async def run_s3(method, **kwargs):
+    """Run a blocking s3_client call in the thread pool so it never stalls the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(thread_pool, partial(method, **kwargs))
+
 # --- Performance Tracking ---
 class TransferStats:
     def __init__(self):
@@ -162,18 +281,19 @@ class TransferStats:
         self.last_update = 0
         
     def start(self):
-        self.start_time = time.time()
+        # Monotonic clock so wall-clock adjustments can't skew the measured speed
+        self.start_time = time.monotonic()
         self.bytes_transferred = 0
         self.last_update = self.start_time
         
     def update(self, bytes_count):
         self.bytes_transferred += bytes_count
-        self.last_update = time.time()
+        self.last_update = time.monotonic()
         
     def get_speed(self):
         if not self.start_time:
             return "0 B/s"
-        elapsed = time.time() - self.start_time
+        elapsed = time.monotonic() - self.start_time
         if elapsed == 0:
             return "0 B/s"
         speed = self.bytes_transferred / elapsed
@@ -181,11 +301,7 @@ class TransferStats:
     
     def human_speed(self, speed):
         """Convert speed to human readable format"""
-        for unit in ['B/s', 'KB/s', 'MB/s', 'GB/s']:
-            if speed < 1024.0:
-                return f"{speed:.2f} {unit}"
-            speed /= 1024.0
-        return f"{speed:.2f} TB/s"
+        return f"{humanbytes(speed)}/s"
 
 # Global stats tracker
 transfer_stats = TransferStats()
@@ -211,57 +327,96 @@ def is_authorized(func):
             await message.reply_text("⛔️ You are not authorized to use this bot. Contact the admin.")
     return wrapper
 
+SIZE_LABELS = ('', 'K', 'M', 'G', 'T')
+SIZE_DIVISORS = tuple(1 << (10 * n) for n in range(len(SIZE_LABELS)))
+
 def humanbytes(size):
     """Converts bytes to a human-readable format."""
     if not size:
         return "0B"
     size = int(size)
-    power = 1024
-    n = 0
-    power_labels = {0: '', 1: 'K', 2: 'M', 3: 'G', 4: 'T'}
-    while size > power and n < len(power_labels) - 1:
-        size /= power
-        n += 1
-    return f"{size:.2f} {power_labels[n]}B"
+    # Step up a unit only once size exceeds 1024**n, i.e. (size - 1) needs more than 10*n bits
+    n = min(max((size - 1).bit_length() - 1, 0) // 10, len(SIZE_LABELS) - 1)
+    return f"{size / SIZE_DIVISORS[n]:.2f} {SIZE_LABELS[n]}B"
 
 def get_file_extension(filename):
     """Extract file extension in lowercase."""
     return os.path.splitext(filename)[1].lower()
 
-def is_video_file(filename):
-    """Check if file is a supported video format."""
-    return get_file_extension(filename) in SUPPORTED_VIDEO_FORMATS
+def get_content_type(filename):
+    """Look up the MIME type for a file from its extension."""
+    return CONTENT_TYPES.get(get_file_extension(filename), DEFAULT_CONTENT_TYPE)
 
 def get_file_type(filename):
     """Determine file type based on extension."""
-    ext = get_file_extension(filename)
-    if ext in SUPPORTED_VIDEO_FORMATS:
-        return 'video'
-    return 'other'
+    return FILE_TYPES.get(get_file_extension(filename), 'other')
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _player_signature(payload):
+    return hmac.new(PLAYER_LINK_SECRET, payload, hashlib.sha256).digest()[:16]
+
+def sign_player_token(key, expires):
+    """Pack an object key and expiry time into a signed, URL-safe player token."""
+    payload = f"{expires}:{key}".encode()
+    return f"{_b64encode(payload)}.{_b64encode(_player_signature(payload))}"
+
+def read_player_token(token):
+    """Return (key, expires) for a valid, unexpired player token, else None."""
+    try:
+        encoded_payload, encoded_sig = token.split('.')
+        payload = _b64decode(encoded_payload)
+        if not hmac.compare_digest(_b64decode(encoded_sig), _player_signature(payload)):
+            return None
+        expires, key = payload.decode().split(':', 1)
+        expires = int(expires)
+    except ValueError:
+        return None
+    if expires <= time.time():
+        return None
+    return key, expires
 
-def generate_player_url(filename, presigned_url):
+def read_legacy_player_url(token):
+    """Return the presigned URL packed into an old-style (unsigned) player token, else None.
+
+    Links issued before signed tokens carried the whole presigned URL; only URLs for our
+    own bucket are accepted, and their 7-day signature still decides when they stop working.
+    """
+    try:
+        url = _b64decode(token).decode()
+    except ValueError:
+        return None
+    if not url.startswith(f"https://{WASABI_BUCKET}.s3.{WASABI_REGION}.wasabisys.com/"):
+        return None
+    return url
+
+def generate_player_url(filename):
     """Generate player URL for supported file types."""
     if not RENDER_URL:
         return None
     file_type = get_file_type(filename)
     if file_type == 'video':
-        encoded_url = base64.urlsafe_b64encode(presigned_url.encode()).decode().rstrip('=')
-        return f"{RENDER_URL}/player/{file_type}/{encoded_url}"
+        token = sign_player_token(filename, int(time.time()) + PRESIGNED_URL_EXPIRY)
+        return f"{RENDER_URL}/player/{file_type}/{token}"
     return None
 
-async def create_link_buttons(direct_url, player_url, filename):
+async def create_link_buttons(direct_url, player_url, filename, admin_controls=True):
     """Create beautiful inline buttons for links with proper callback data"""
     buttons = []
     
-    # Store filename and get short callback ID
-    file_id = callback_data.store_file(filename)
-    
     # Shorten URLs if enabled
     shortened_direct, shortened_player = await shorten_all_urls(direct_url, player_url)
     
-    # Use shortened URLs if available, otherwise original
-    display_direct = shortened_direct if shortened_direct and shortened_direct != direct_url else direct_url
-    display_player = shortened_player if shortened_player and shortened_player != player_url else player_url
+    # shorten_url_gplinks already falls back to the original URL, so no comparison is needed
+    display_direct = shortened_direct or direct_url
+    display_player = shortened_player or player_url
+    
+    # Store filename with the final links so the copy buttons don't re-sign or re-shorten
+    file_id = callback_data.store_file(filename, (display_direct, display_player))
     
     # Always add direct download button
     if display_direct:
@@ -283,68 +438,126 @@ async def create_link_buttons(direct_url, player_url, filename):
         ])
     
     # Add admin buttons for admin users
-    buttons.append([
-        InlineKeyboardButton("🗑 Delete File", callback_data=f"del_{file_id}"),
-        InlineKeyboardButton("🔄 New Links", callback_data=f"ref_{file_id}")
-    ])
+    if admin_controls:
+        buttons.append([
+            InlineKeyboardButton("🗑 Delete File", callback_data=f"del_{file_id}"),
+            InlineKeyboardButton("🔄 New Links", callback_data=f"ref_{file_id}")
+        ])
     
     return InlineKeyboardMarkup(buttons)
 
 async def create_simple_buttons(direct_url, player_url, filename):
     """Create simple buttons for non-admin users"""
-    buttons = []
-    
-    # Store filename and get short callback ID
-    file_id = callback_data.store_file(filename)
-    
-    # Shorten URLs if enabled
-    shortened_direct, shortened_player = await shorten_all_urls(direct_url, player_url)
-    
-    # Use shortened URLs if available, otherwise original
-    display_direct = shortened_direct if shortened_direct and shortened_direct != direct_url else direct_url
-    display_player = shortened_player if shortened_player and shortened_player != player_url else player_url
-    
-    if display_direct:
-        buttons.append([InlineKeyboardButton("📥 Direct Download", url=display_direct)])
-    
-    if display_player:
-        buttons.append([InlineKeyboardButton("🎥 Stream Video", url=display_player)])
-    
-    if direct_url:
-        buttons.append([
-            InlineKeyboardButton("📋 Copy Direct", callback_data=f"cd_{file_id}"),
-            InlineKeyboardButton("📋 Copy Player", callback_data=f"cp_{file_id}")
-        ])
-    
-    return InlineKeyboardMarkup(buttons)
+    return await create_link_buttons(direct_url, player_url, filename, admin_controls=False)
 
 # --- Ultra-Fast Progress Callback ---
+# Keyed by (chat_id, message_id): message ids are only unique within a chat
 last_update_time = {}
+last_percentage = {}
 progress_cache = {}
+PROGRESS_MIN_DELTA = 1.0  # Percentage points a transfer must advance between edits
+
+# Latest unsent progress text per (chat_id, message_id); only the newest value is ever sent
+pending_edits = {}
+# Progress edit currently being sent per (chat_id, message_id), so a finished transfer can stop it
+inflight_edits = {}
+# Chats under a FloodWait longer than the client's sleep_threshold: chat_id -> monotonic resume time
+chat_backoff = {}
+PROGRESS_FLUSH_INTERVAL = 1.0  # Seconds between progress edit rounds
+PROGRESS_EDITS_PER_ROUND = 20  # Bot-wide cap, under Telegram's ~30/s so replies still get through
+progress_flusher_task = None
+
+# Every possible 20-cell bar, built once and indexed by filled cells
+PROGRESS_BAR_CELLS = 20
+PROGRESS_BARS = tuple(
+    f"[{'█' * filled}{'░' * (PROGRESS_BAR_CELLS - filled)}]"
+    for filled in range(PROGRESS_BAR_CELLS + 1)
+)
+
+async def progress_flusher():
+    """Send the newest pending progress text, at most one message per chat per interval."""
+    while True:
+        await asyncio.sleep(PROGRESS_FLUSH_INTERVAL)
+        # Telegram allows about one edit per second per chat, so concurrent uploads in one
+        # chat take turns; sent keys are popped and re-queue at the back, giving round-robin
+        edited_chats = set()
+        now = time.monotonic()
+        for chat_id in [c for c, until in chat_backoff.items() if until <= now]:
+            del chat_backoff[chat_id]
+        for key in list(pending_edits):
+            if len(edited_chats) >= PROGRESS_EDITS_PER_ROUND:
+                break
+            chat_id, message_id = key
+            if chat_id in edited_chats or chat_id in chat_backoff:
+                continue
+            text = pending_edits.pop(key, None)
+            if text is None:
+                continue
+            edited_chats.add(chat_id)
+            # Run the edit as its own task; discard_progress cancels it if the transfer ends first
+            edit = asyncio.ensure_future(app.edit_message_text(chat_id, message_id, text=text))
+            inflight_edits[key] = edit
+            await asyncio.wait((edit,))
+            inflight_edits.pop(key, None)
+            if edit.cancelled():
+                continue
+            e = edit.exception()
+            if isinstance(e, FloodWait):
+                # Pause only this chat for as long as Telegram asks and keep serving the others;
+                # the text goes back in the queue unless newer text has arrived meanwhile
+                logger.warning(f"Progress edits for chat {chat_id} paused for {e.value}s (FloodWait)")
+                chat_backoff[chat_id] = time.monotonic() + e.value
+                pending_edits.setdefault(key, text)
+            elif e is not None:
+                logger.debug(f"Progress update skipped: {e}")
+
+def queue_progress_edit(chat_id, message_id, text):
+    """Record the latest progress text for a message and make sure the flusher is running."""
+    global progress_flusher_task
+    pending_edits[(chat_id, message_id)] = text
+    if progress_flusher_task is None or progress_flusher_task.done():
+        progress_flusher_task = asyncio.get_running_loop().create_task(progress_flusher())
+
+async def discard_progress(message):
+    """Drop unsent progress text and stop any edit in flight so neither can overwrite a later status edit."""
+    key = (message.chat.id, message.id)
+    pending_edits.pop(key, None)
+    # An edit already sent (or sleeping through a FloodWait inside Pyrogram) would otherwise
+    # land after the final status edit and replace the link keyboard with a progress bar
+    edit = inflight_edits.get(key)
+    if edit is not None:
+        edit.cancel()
+        await asyncio.wait((edit,))
 
 async def progress_callback(current, total, message, status, operation_type="download"):
     """High-performance progress updates with speed tracking."""
     chat_id = message.chat.id
     message_id = message.id
+    key = (chat_id, message_id)
     
     # Update transfer stats
     if operation_type == "download":
-        transfer_stats.update(current - progress_cache.get(message_id, 0))
+        transfer_stats.update(current - progress_cache.get(key, 0))
     
-    progress_cache[message_id] = current
+    progress_cache[key] = current
     
-    # Throttle UI updates (every 1 second or when complete)
-    now = time.time()
-    if (now - last_update_time.get(message_id, 0)) < 1.0 and current != total:
+    # Throttle UI updates (every 1 second and 1% of progress, or when complete);
+    # nothing is sent before the first 1%, so a fresh transfer doesn't edit in a 0% bar
+    now = time.monotonic()
+    percentage = current * 100 / total
+    if current != total and (
+        (now - last_update_time.get(key, 0)) < 1.0
+        or (percentage - last_percentage.get(key, 0.0)) < PROGRESS_MIN_DELTA
+    ):
         return
     
-    last_update_time[message_id] = now
+    last_update_time[key] = now
+    if current == total:
+        last_percentage.pop(key, None)
+    else:
+        last_percentage[key] = percentage
 
-    percentage = current * 100 / total
-    progress_bar = "[{0}{1}]".format(
-        '█' * int(percentage / 5),
-        '░' * (20 - int(percentage / 5))
-    )
+    progress_bar = PROGRESS_BARS[min(int(percentage / 5), PROGRESS_BAR_CELLS)]
     
     speed = transfer_stats.get_speed()
     
@@ -356,127 +569,60 @@ async def progress_callback(current, total, message, status, operation_type="dow
         f"**Done:** {humanbytes(current)} / {humanbytes(total)}"
     )
     
-    try:
-        await app.edit_message_text(chat_id, message_id, text=details)
-    except Exception as e:
-        logger.debug(f"Progress update skipped: {e}")
+    queue_progress_edit(chat_id, message_id, details)
 
 # --- Ultra-Fast S3 Operations ---
-async def upload_to_wasabi_parallel(file_path, file_name, status_message):
-    """Ultra-fast parallel multipart upload with instant speeds"""
+async def upload_to_wasabi_parallel(file_path, file_name, status_message, file_size=None):
+    """Ultra-fast upload of a local file; TRANSFER_CONFIG splits large files into parallel parts"""
     try:
-        file_size = os.path.getsize(file_path)
+        # Callers that already know the size skip the stat
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
         
-        # Use multipart upload for files larger than 50MB
-        if file_size > 50 * 1024 * 1024:
-            return await upload_multipart(file_path, file_name, file_size, status_message)
-        else:
-            return await upload_single(file_path, file_name, file_size, status_message)
+        return await upload_single(file_path, file_name, file_size, status_message)
             
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         raise e
+    finally:
+        await discard_progress(status_message)
 
-async def upload_multipart(file_path, file_name, file_size, status_message):
-    """Multipart upload for large files - maximum speed"""
-    try:
-        # Create multipart upload
-        mpu = s3_client.create_multipart_upload(
-            Bucket=WASABI_BUCKET,
-            Key=file_name,
-            ContentType='application/octet-stream'
-        )
-        mpu_id = mpu['UploadId']
-        
-        # Calculate parts
-        part_size = CHUNK_SIZE
-        part_count = math.ceil(file_size / part_size)
-        parts = []
-        
-        logger.info(f"Starting multipart upload: {part_count} parts")
-        
-        # Upload parts in parallel
-        upload_tasks = []
-        
-        for part_num in range(1, part_count + 1):
-            start = (part_num - 1) * part_size
-            end = min(start + part_size, file_size)
-            
-            task = upload_part(
-                file_path, file_name, mpu_id, part_num, start, end, status_message
-            )
-            upload_tasks.append(task)
-        
-        # Execute all uploads in parallel
-        parts = await asyncio.gather(*upload_tasks)
-        
-        # Complete multipart upload
-        s3_client.complete_multipart_upload(
-            Bucket=WASABI_BUCKET,
-            Key=file_name,
-            UploadId=mpu_id,
-            MultipartUpload={'Parts': parts}
-        )
-        
-        logger.info("Multipart upload completed successfully")
-        return True
-        
-    except Exception as e:
-        # Abort upload on failure
-        try:
-            s3_client.abort_multipart_upload(
-                Bucket=WASABI_BUCKET,
-                Key=file_name,
-                UploadId=mpu_id
-            )
-        except:
-            pass
-        raise e
-
-async def upload_part(file_path, file_name, mpu_id, part_num, start, end, status_message):
-    """Upload a single part with progress tracking"""
-    loop = asyncio.get_event_loop()
+class S3UploadProgress:
+    """boto3 Callback that forwards upload progress to the event loop."""
+    def __init__(self, file_size, status_message, loop):
+        self.uploaded = 0
+        self.file_size = file_size
+        self.status_message = status_message
+        self.loop = loop
+        # Transfer threads call in concurrently; the lock keeps the byte count exact
+        self._lock = Lock()
+        self._last_report = 0.0
     
-    def _upload_part():
-        with open(file_path, 'rb') as f:
-            f.seek(start)
-            data = f.read(end - start)
-            
-            response = s3_client.upload_part(
-                Bucket=WASABI_BUCKET,
-                Key=file_name,
-                PartNumber=part_num,
-                UploadId=mpu_id,
-                Body=data
-            )
-            
-            return {'ETag': response['ETag'], 'PartNumber': part_num}
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.uploaded += bytes_amount
+            uploaded = self.uploaded
+            now = time.monotonic()
+            # Only cross into the loop about once a second, plus the final tick
+            if uploaded < self.file_size and now - self._last_report < 1.0:
+                return
+            self._last_report = now
+        self.loop.call_soon_threadsafe(self._report, uploaded)
     
-    return await loop.run_in_executor(thread_pool, _upload_part)
+    def _report(self, uploaded):
+        """Runs on the event loop thread."""
+        self.loop.create_task(progress_callback(
+            uploaded,
+            self.file_size,
+            self.status_message,
+            "🚀 Uploading...",
+            "upload"
+        ))
 
 async def upload_single(file_path, file_name, file_size, status_message):
     """Single upload for smaller files"""
-    loop = asyncio.get_event_loop()
-    
-    class ProgressTracker:
-        def __init__(self):
-            self.uploaded = 0
-            self.file_size = file_size
-        
-        def __call__(self, bytes_amount):
-            self.uploaded += bytes_amount
-            asyncio.run_coroutine_threadsafe(
-                progress_callback(
-                    self.uploaded, 
-                    self.file_size, 
-                    status_message, 
-                    "🚀 Uploading...",
-                    "upload"
-                ),
-                loop
-            )
-    
-    progress_tracker = ProgressTracker()
+    loop = asyncio.get_running_loop()
+    progress_tracker = S3UploadProgress(file_size, status_message, loop)
     
     await loop.run_in_executor(
         thread_pool,
@@ -484,61 +630,250 @@ async def upload_single(file_path, file_name, file_size, status_message):
             file_path,
             WASABI_BUCKET,
             file_name,
+            ExtraArgs={'ContentType': get_content_type(file_name)},
+            Config=TRANSFER_CONFIG,
             Callback=progress_tracker
         )
     )
     return True
 
-async def generate_presigned_url(file_name):
-    """Generate presigned URL with error handling."""
+async def stream_to_wasabi(client, message, file_name, file_size, status_message):
+    """Pipe a Telegram download straight into upload_fileobj without staging the file."""
+    async with stream_slots:
+        return await _stream_to_wasabi(client, message, file_name, file_size, status_message)
+
+async def _stream_to_wasabi(client, message, file_name, file_size, status_message):
+    loop = asyncio.get_running_loop()
+    read_fd, write_fd = os.pipe()
+    reader = os.fdopen(read_fd, 'rb')
+    writer = os.fdopen(write_fd, 'wb')
+    
+    # boto3 handles the non-seekable pipe by buffering and uploading parts as they fill
+    upload = loop.run_in_executor(
+        stream_pool,
+        lambda: s3_client.upload_fileobj(
+            reader,
+            WASABI_BUCKET,
+            file_name,
+            ExtraArgs={'ContentType': get_content_type(file_name)},
+            Config=STREAM_TRANSFER_CONFIG
+        )
+    )
+    # If the upload stops reading, closing the read end turns blocked writes into BrokenPipeError
+    upload.add_done_callback(lambda _: reader.close())
+    
     try:
-        return s3_client.generate_presigned_url(
-            'get_object',
+        await download_file_ultrafast(client, message, writer, file_size, status_message)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            writer.close()
+        # A failed upload is what broke the pipe, so report that instead of the write error
+        await upload
+        # The uploader saw a clean EOF and stored a truncated object; remove it
+        await run_s3(s3_client.delete_object, Bucket=WASABI_BUCKET, Key=file_name)
+        raise
+    
+    # EOF on the pipe tells upload_fileobj the stream is complete
+    with contextlib.suppress(OSError):
+        writer.close()
+    await upload
+    return True
+
+# Recently signed URLs: key -> (signed_at, url), least recently used first
+presigned_cache = OrderedDict()
+PRESIGNED_CACHE_SIZE = 1024
+PRESIGNED_REUSE_WINDOW = PRESIGNED_URL_EXPIRY // 2  # Reused URLs always have at least half their life left
+
+async def generate_presigned_url(file_name, fresh=False):
+    """Generate presigned URL with error handling, reusing a recent signature unless fresh is set."""
+    now = time.monotonic()
+    cached = presigned_cache.get(file_name)
+    if cached and not fresh and now - cached[0] < PRESIGNED_REUSE_WINDOW:
+        presigned_cache.move_to_end(file_name)
+        return cached[1]
+    try:
+        url = await run_s3(
+            s3_client.generate_presigned_url,
+            ClientMethod='get_object',
             Params={'Bucket': WASABI_BUCKET, 'Key': file_name},
-            ExpiresIn=604800  # 7 days
+            ExpiresIn=PRESIGNED_URL_EXPIRY
         )
     except ClientError as e:
         logger.error(f"Failed to generate presigned URL: {e}")
         return None
+    presigned_cache[file_name] = (now, url)
+    presigned_cache.move_to_end(file_name)
+    if len(presigned_cache) > PRESIGNED_CACHE_SIZE:
+        presigned_cache.popitem(last=False)
+    return url
 
 # --- Optimized File Download ---
-async def download_file_ultrafast(client, message, file_path, status_message):
-    """Ultra-fast file download from Telegram"""
+async def download_file_ultrafast(client, message, file_obj, file_size, status_message):
+    """Ultra-fast file download from Telegram into an open file object"""
+    loop = asyncio.get_running_loop()
     try:
         # Start transfer stats
         transfer_stats.start()
-        progress_cache[status_message.id] = 0
+        progress_key = (status_message.chat.id, status_message.id)
+        progress_cache[progress_key] = 0
         
-        await client.download_media(
-            message=message,
-            file_name=file_path,
-            progress=progress_callback,
-            progress_args=(status_message, "⬇️ Downloading...", "download")
-        )
+        received = 0
+        async for chunk in client.stream_media(message):
+            # Writes block while the reader catches up, so keep them off the event loop
+            # (and off thread_pool, see stream_pool)
+            await loop.run_in_executor(stream_pool, file_obj.write, chunk)
+            received += len(chunk)
+            await progress_callback(received, file_size, status_message, "🚀 Transferring...", "download")
         
         # Clear progress cache
-        if status_message.id in progress_cache:
-            del progress_cache[status_message.id]
+        progress_cache.pop(progress_key, None)
             
     except Exception as e:
         logger.error(f"Download failed: {e}")
         raise e
+    finally:
+        await discard_progress(status_message)
+
+def scratch_dir_for(file_size):
+    """Pick tmpfs for scratch files when there is comfortable RAM headroom, else the default temp dir."""
+    if os.path.isdir(TMPFS_DIR) and psutil.virtual_memory().available > file_size * 1.2:
+        return TMPFS_DIR
+    return None
+
+def _write_random_file(path, size):
+    """Fill a local file with random bytes (speed test payload)."""
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+
+def _remove_local_file(path):
+    """Delete a local temp file if it is still present."""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+async def cleanup_local_file(path):
+    """Remove a temp file on the worker pool so slow disks don't stall the event loop."""
+    await asyncio.get_running_loop().run_in_executor(thread_pool, _remove_local_file, path)
 
 # --- Fixed Callback Query Handler ---
+async def copy_direct_action(client, callback_query, file_id, filename):
+    """Send the direct download link for a file."""
+    message = callback_query.message
+    if callback_query.from_user.id not in ALLOWED_USERS:
+        await callback_query.answer("⛔️ You are not authorized!", show_alert=True)
+        return
+        
+    links = callback_data.get_links(file_id)
+    if links:
+        shortened_url = links[0]
+    else:
+        presigned_url = await generate_presigned_url(filename)
+        # Shorten URL for copying
+        shortened_url = await shorten_url_gplinks(presigned_url) if presigned_url else None
+    
+    if shortened_url:
+        await callback_query.answer("📋 Direct link copied!", show_alert=False)
+        # Send link as message
+        await message.reply_text(
+            f"**Direct Download Link:**\n`{shortened_url}`",
+            reply_to_message_id=message.id
+        )
+    else:
+        await callback_query.answer("❌ Failed to generate link", show_alert=True)
+
+async def copy_player_action(client, callback_query, file_id, filename):
+    """Send the web player link for a video file."""
+    message = callback_query.message
+    if callback_query.from_user.id not in ALLOWED_USERS:
+        await callback_query.answer("⛔️ You are not authorized!", show_alert=True)
+        return
+        
+    links = callback_data.get_links(file_id)
+    if links:
+        shortened_player = links[1]
+    else:
+        player_url = generate_player_url(filename)
+        # Shorten player URL for copying
+        shortened_player = await shorten_url_gplinks(player_url) if player_url else None
+    
+    if shortened_player:
+        await callback_query.answer("📋 Player link copied!", show_alert=False)
+        await message.reply_text(
+            f"**Player URL:**\n{shortened_player}",
+            reply_to_message_id=message.id
+        )
+    else:
+        await callback_query.answer("❌ Not a video file", show_alert=True)
+
+async def delete_file_action(client, callback_query, file_id, filename):
+    """Delete a file from Wasabi (admin only)."""
+    if callback_query.from_user.id != ADMIN_ID:
+        await callback_query.answer("⛔️ Only admin can delete!", show_alert=True)
+        return
+        
+    try:
+        await run_s3(s3_client.delete_object, Bucket=WASABI_BUCKET, Key=filename)
+        presigned_cache.pop(filename, None)
+        await callback_query.answer("✅ File deleted!", show_alert=True)
+        await callback_query.message.edit_text(
+            f"🗑 **File Deleted**\n\n`{filename}` has been removed from storage.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔙 Back to Bot", url=f"https://t.me/{client.me.username}")]
+            ])
+        )
+        # Clean up callback data
+        callback_data.clear_file(file_id)
+    except Exception as e:
+        await callback_query.answer(f"❌ Delete failed", show_alert=True)
+
+async def refresh_links_action(client, callback_query, file_id, filename):
+    """Replace the link buttons with freshly signed URLs."""
+    user_id = callback_query.from_user.id
+    if user_id not in ALLOWED_USERS:
+        await callback_query.answer("⛔️ You are not authorized!", show_alert=True)
+        return
+        
+    await callback_query.answer("🔄 Generating fresh links...")
+    
+    # Generate new presigned URLs; skip the cache so the user gets a full 7-day link
+    presigned_url = await generate_presigned_url(filename, fresh=True)
+    player_url = generate_player_url(filename)
+    
+    if presigned_url:
+        # Create appropriate buttons based on user role
+        if user_id == ADMIN_ID:
+            keyboard = await create_link_buttons(presigned_url, player_url, filename)
+        else:
+            keyboard = await create_simple_buttons(presigned_url, player_url, filename)
+        
+        # Update message with new buttons
+        await callback_query.message.edit_reply_markup(reply_markup=keyboard)
+        await callback_query.answer("✅ Links refreshed!", show_alert=False)
+    else:
+        await callback_query.answer("❌ Failed to refresh links", show_alert=True)
+
+# Callback data prefix -> action handler
+CALLBACK_ACTIONS = {
+    "cd": copy_direct_action,    # Copy Direct
+    "cp": copy_player_action,    # Copy Player
+    "del": delete_file_action,   # Delete
+    "ref": refresh_links_action, # Refresh
+}
+
 @app.on_callback_query()
 async def handle_callback_query(client, callback_query):
     """Handle button callbacks with proper data validation"""
-    user_id = callback_query.from_user.id
-    data = callback_query.data
-    message = callback_query.message
-    
     try:
         # Parse callback data (format: "action_id")
-        if '_' not in data:
+        action, _, file_id = callback_query.data.partition('_')
+        if not file_id:
             await callback_query.answer("❌ Invalid button data", show_alert=False)
             return
+        
+        handler = CALLBACK_ACTIONS.get(action)
+        if handler is None:
+            await callback_query.answer("❌ Unknown action", show_alert=True)
+            return
             
-        action, file_id = data.split('_', 1)
         filename = callback_data.get_file(file_id)
         
         if not filename:
@@ -546,105 +881,56 @@ async def handle_callback_query(client, callback_query):
             return
         
         logger.info(f"Callback: {action} for file: {filename}")
-        
-        if action == "cd":  # Copy Direct
-            if user_id not in ALLOWED_USERS:
-                await callback_query.answer("⛔️ You are not authorized!", show_alert=True)
-                return
-                
-            presigned_url = await generate_presigned_url(filename)
-            
-            if presigned_url:
-                # Shorten URL for copying
-                shortened_url = await shorten_url_gplinks(presigned_url)
-                await callback_query.answer("📋 Direct link copied!", show_alert=False)
-                # Send link as message
-                await message.reply_text(
-                    f"**Direct Download Link:**\n`{shortened_url}`",
-                    reply_to_message_id=message.id
-                )
-            else:
-                await callback_query.answer("❌ Failed to generate link", show_alert=True)
-                
-        elif action == "cp":  # Copy Player
-            if user_id not in ALLOWED_USERS:
-                await callback_query.answer("⛔️ You are not authorized!", show_alert=True)
-                return
-                
-            presigned_url = await generate_presigned_url(filename)
-            player_url = generate_player_url(filename, presigned_url) if presigned_url else None
-            
-            if player_url:
-                # Shorten player URL for copying
-                shortened_player = await shorten_url_gplinks(player_url)
-                await callback_query.answer("📋 Player link copied!", show_alert=False)
-                await message.reply_text(
-                    f"**Player URL:**\n{shortened_player}",
-                    reply_to_message_id=message.id
-                )
-            else:
-                await callback_query.answer("❌ Not a video file", show_alert=True)
-                
-        elif action == "del":  # Delete
-            if user_id != ADMIN_ID:
-                await callback_query.answer("⛔️ Only admin can delete!", show_alert=True)
-                return
-                
-            try:
-                s3_client.delete_object(Bucket=WASABI_BUCKET, Key=filename)
-                await callback_query.answer("✅ File deleted!", show_alert=True)
-                await message.edit_text(
-                    f"🗑 **File Deleted**\n\n`{filename}` has been removed from storage.",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("🔙 Back to Bot", url=f"https://t.me/{client.me.username}")]
-                    ])
-                )
-                # Clean up callback data
-                callback_data.clear_file(file_id)
-            except Exception as e:
-                await callback_query.answer(f"❌ Delete failed", show_alert=True)
-                
-        elif action == "ref":  # Refresh
-            if user_id not in ALLOWED_USERS:
-                await callback_query.answer("⛔️ You are not authorized!", show_alert=True)
-                return
-                
-            await callback_query.answer("🔄 Generating fresh links...")
-            
-            # Generate new presigned URLs
-            presigned_url = await generate_presigned_url(filename)
-            player_url = generate_player_url(filename, presigned_url) if is_video_file(filename) else None
-            
-            if presigned_url:
-                # Create appropriate buttons based on user role
-                if user_id == ADMIN_ID:
-                    keyboard = await create_link_buttons(presigned_url, player_url, filename)
-                else:
-                    keyboard = await create_simple_buttons(presigned_url, player_url, filename)
-                
-                # Update message with new buttons
-                await message.edit_reply_markup(reply_markup=keyboard)
-                await callback_query.answer("✅ Links refreshed!", show_alert=False)
-            else:
-                await callback_query.answer("❌ Failed to refresh links", show_alert=True)
-                
-        else:
-            await callback_query.answer("❌ Unknown action", show_alert=True)
+        await handler(client, callback_query, file_id, filename)
             
     except Exception as e:
         logger.error(f"Callback error: {e}")
         await callback_query.answer("❌ An error occurred", show_alert=True)
 
+# --- Static Keyboards ---
+# Built once at import; these menus never change between calls
+START_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📁 Upload File", callback_data="upload_help")],
+    [InlineKeyboardButton("ℹ️ Help", callback_data="help_info"),
+     InlineKeyboardButton("👤 My ID", callback_data="my_id")],
+    [InlineKeyboardButton("🚀 Speed Test", callback_data="speed_test")]
+])
+
+HELP_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📁 Upload Guide", callback_data="upload_guide")],
+    [InlineKeyboardButton("🎥 Player Guide", callback_data="player_guide")],
+    [InlineKeyboardButton("⚡ Speed Tips", callback_data="speed_tips")],
+    [InlineKeyboardButton("🔗 Shortener Info", callback_data="shortener_info")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
+])
+
+USER_CHANGED_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("👥 List Users", callback_data="list_users")],
+    [InlineKeyboardButton("🔙 Admin Panel", callback_data="admin_panel")]
+])
+
+LIST_USERS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Add User", callback_data="add_user_dialog")],
+    [InlineKeyboardButton("➖ Remove User", callback_data="remove_user_dialog")],
+    [InlineKeyboardButton("🔙 Admin Panel", callback_data="admin_panel")]
+])
+
+STATS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Refresh Stats", callback_data="refresh_stats")],
+    [InlineKeyboardButton("🚀 Speed Test", callback_data="speed_test")],
+    [InlineKeyboardButton("🔗 Toggle Shortener", callback_data="toggle_shortener")],
+    [InlineKeyboardButton("🔙 Admin Panel", callback_data="admin_panel")]
+])
+
+SPEED_TEST_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Test Again", callback_data="speed_test")],
+    [InlineKeyboardButton("📊 More Stats", callback_data="more_stats")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
+])
+
 # --- Bot Command Handlers ---
 @app.on_message(filters.command("start"))
 async def start_handler(client: Client, message: Message):
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📁 Upload File", callback_data="upload_help")],
-        [InlineKeyboardButton("ℹ️ Help", callback_data="help_info"),
-         InlineKeyboardButton("👤 My ID", callback_data="my_id")],
-        [InlineKeyboardButton("🚀 Speed Test", callback_data="speed_test")]
-    ])
-    
     await message.reply_text(
         f"🚀 **Ultra-Fast Wasabi Upload Bot**\n\n"
         f"**Your User ID:** `{message.from_user.id}`\n\n"
@@ -655,19 +941,11 @@ async def start_handler(client: Client, message: Message):
         "• 🔗 7-day direct links\n"
         f"• 🔗 Auto URL shortening: {'✅ Enabled' if AUTO_SHORTEN and GPLINKS_API_KEY else '❌ Disabled'}\n\n"
         "**Just send any file to start!**",
-        reply_markup=keyboard
+        reply_markup=START_KEYBOARD
     )
 
 @app.on_message(filters.command("help"))
 async def help_handler(client: Client, message: Message):
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📁 Upload Guide", callback_data="upload_guide")],
-        [InlineKeyboardButton("🎥 Player Guide", callback_data="player_guide")],
-        [InlineKeyboardButton("⚡ Speed Tips", callback_data="speed_tips")],
-        [InlineKeyboardButton("🔗 Shortener Info", callback_data="shortener_info")],
-        [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
-    ])
-    
     shortener_status = "✅ Enabled (GPLinks.in)" if AUTO_SHORTEN and GPLINKS_API_KEY else "❌ Disabled"
     
     help_text = f"""
@@ -694,7 +972,7 @@ async def help_handler(client: Client, message: Message):
 /speedtest - Test upload speed
 /toggleshorten - Toggle URL shortening (Admin)
 """
-    await message.reply_text(help_text, reply_markup=keyboard)
+    await message.reply_text(help_text, reply_markup=HELP_KEYBOARD)
 
 @app.on_message(filters.command("toggleshorten"))
 @is_admin
@@ -721,14 +999,9 @@ async def add_user_handler(client: Client, message: Message):
         user_id_to_add = int(message.text.split(" ", 1)[1])
         ALLOWED_USERS.add(user_id_to_add)
         
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("👥 List Users", callback_data="list_users")],
-            [InlineKeyboardButton("🔙 Admin Panel", callback_data="admin_panel")]
-        ])
-        
         await message.reply_text(
             f"✅ User `{user_id_to_add}` has been added successfully.",
-            reply_markup=keyboard
+            reply_markup=USER_CHANGED_KEYBOARD
         )
     except (IndexError, ValueError):
         await message.reply_text("⚠️ **Usage:** /adduser `<user_id>`")
@@ -744,14 +1017,9 @@ async def remove_user_handler(client: Client, message: Message):
         if user_id_to_remove in ALLOWED_USERS:
             ALLOWED_USERS.remove(user_id_to_remove)
             
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("👥 List Users", callback_data="list_users")],
-                [InlineKeyboardButton("🔙 Admin Panel", callback_data="admin_panel")]
-            ])
-            
             await message.reply_text(
                 f"🗑 User `{user_id_to_remove}` has been removed.",
-                reply_markup=keyboard
+                reply_markup=USER_CHANGED_KEYBOARD
             )
         else:
             await message.reply_text("🤷 User not found in the authorized list.")
@@ -763,15 +1031,9 @@ async def remove_user_handler(client: Client, message: Message):
 async def list_users_handler(client: Client, message: Message):
     user_list = "\n".join([f"- `{user_id}`" for user_id in ALLOWED_USERS])
     
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("➕ Add User", callback_data="add_user_dialog")],
-        [InlineKeyboardButton("➖ Remove User", callback_data="remove_user_dialog")],
-        [InlineKeyboardButton("🔙 Admin Panel", callback_data="admin_panel")]
-    ])
-    
     await message.reply_text(
         f"👥 **Authorized Users:**\n{user_list}\n\n**Total:** {len(ALLOWED_USERS)} users",
-        reply_markup=keyboard
+        reply_markup=LIST_USERS_KEYBOARD
     )
 
 @app.on_message(filters.command("stats"))
@@ -792,14 +1054,7 @@ async def stats_handler(client: Client, message: Message):
         f"• Player URL: {RENDER_URL}"
     )
     
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("🔄 Refresh Stats", callback_data="refresh_stats")],
-        [InlineKeyboardButton("🚀 Speed Test", callback_data="speed_test")],
-        [InlineKeyboardButton("🔗 Toggle Shortener", callback_data="toggle_shortener")],
-        [InlineKeyboardButton("🔙 Admin Panel", callback_data="admin_panel")]
-    ])
-    
-    await message.reply_text(stats_text, reply_markup=keyboard)
+    await message.reply_text(stats_text, reply_markup=STATS_KEYBOARD)
 
 @app.on_message(filters.command("speedtest"))
 @is_authorized
@@ -810,44 +1065,38 @@ async def speed_test_handler(client: Client, message: Message):
     # Create a test file
     test_size = 10 * 1024 * 1024  # 10MB
     test_filename = f"speedtest_{int(time.time())}.bin"
-    test_filepath = f"./downloads/{test_filename}"
+    test_filepath = os.path.join(scratch_dir_for(test_size) or "./downloads", test_filename)
     
     try:
-        # Create test file with random data
-        with open(test_filepath, 'wb') as f:
-            f.write(os.urandom(test_size))
+        # Create test file with random data; 10MB of urandom plus the write would stall the loop
+        await asyncio.get_running_loop().run_in_executor(
+            thread_pool, _write_random_file, test_filepath, test_size
+        )
         
         # Upload with timing
         start_time = time.time()
-        await upload_to_wasabi_parallel(test_filepath, test_filename, test_message)
+        await upload_to_wasabi_parallel(test_filepath, test_filename, test_message, test_size)
         upload_time = time.time() - start_time
         
         speed = test_size / upload_time
         speed_human = transfer_stats.human_speed(speed)
         
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔄 Test Again", callback_data="speed_test")],
-            [InlineKeyboardButton("📊 More Stats", callback_data="more_stats")],
-            [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
-        ])
-        
         await test_message.edit_text(
             f"📊 **Speed Test Results**\n\n"
             f"• File Size: {humanbytes(test_size)}\n"
             f"• Upload Time: {upload_time:.2f}s\n"
             f"• Average Speed: {speed_human}\n"
             f"• Status: ✅ Ultra-Fast Mode Active",
-            reply_markup=keyboard
+            reply_markup=SPEED_TEST_KEYBOARD
         )
         
         # Cleanup
-        os.remove(test_filepath)
-        s3_client.delete_object(Bucket=WASABI_BUCKET, Key=test_filename)
+        await cleanup_local_file(test_filepath)
+        await run_s3(s3_client.delete_object, Bucket=WASABI_BUCKET, Key=test_filename)
         
     except Exception as e:
         await test_message.edit_text(f"❌ Speed test failed: {str(e)}")
-        if os.path.exists(test_filepath):
-            os.remove(test_filepath)
+        await cleanup_local_file(test_filepath)
 
 # --- Fixed File Handling with Proper Callback Data ---
 @app.on_message(filters.document | filters.video | filters.audio)
@@ -867,30 +1116,29 @@ async def file_handler(client: Client, message: Message):
         return
 
     status_message = await message.reply_text("🚀 Starting ultra-fast transfer...")
+    # The chat action shows activity until the first real progress edit, without spending an edit;
+    # it is purely cosmetic, so a failure here must not abandon the status message
+    with contextlib.suppress(Exception):
+        await client.send_chat_action(message.chat.id, ChatAction.UPLOAD_DOCUMENT)
     
-    # Create unique file path
+    # Create unique object key
     timestamp = int(time.time())
     safe_filename = f"{timestamp}_{file_name}"
-    file_path = f"./downloads/{safe_filename}"
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
     try:
-        # 1. Ultra-fast download from Telegram
-        await download_file_ultrafast(client, message, file_path, status_message)
-        await status_message.edit_text("✅ Download complete. Starting instant upload...")
-
-        # 2. Ultra-fast upload to Wasabi
-        await upload_to_wasabi_parallel(file_path, safe_filename, status_message)
+        # 1-2. Stream from Telegram straight into Wasabi
+        await stream_to_wasabi(client, message, safe_filename, file_size, status_message)
+        # A queued progress edit must not land on top of the status edits below
+        await discard_progress(status_message)
         
-        # Show shortening status if enabled
+        # Shortening waits on GPLinks, so say so; plain links are ready almost at once
         if AUTO_SHORTEN and GPLINKS_API_KEY:
             await status_message.edit_text("✅ Upload complete! Shortening URLs...")
-        else:
-            await status_message.edit_text("✅ Upload complete! Generating links...")
         
         # 3. Generate URLs
         presigned_url = await generate_presigned_url(safe_filename)
-        player_url = generate_player_url(safe_filename, presigned_url) if is_video_file(file_name) else None
+        # generate_player_url returns None for anything that isn't a supported video
+        player_url = generate_player_url(safe_filename)
         
         # 4. Create buttons based on user role with proper callback data
         if message.from_user.id == ADMIN_ID:
@@ -914,11 +1162,8 @@ async def file_handler(client: Client, message: Message):
 
     except Exception as e:
         logger.error(f"Transfer failed: {e}")
+        await discard_progress(status_message)
         await status_message.edit_text(f"❌ **Transfer failed:** {str(e)}")
-    finally:
-        # Cleanup local file
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
 # --- Flask Web Server for Player ---
 web_app = Flask(__name__)
@@ -927,13 +1172,31 @@ web_app = Flask(__name__)
 def index():
     return render_template('index.html', render_url=RENDER_URL)
 
-@web_app.route('/player/<file_type>/<encoded_url>')
-def player(file_type, encoded_url):
+@web_app.route('/player/<file_type>/<token>')
+def player(file_type, token):
     try:
-        # Decode the URL
-        padding = 4 - (len(encoded_url) % 4)
-        encoded_url += '=' * padding
-        video_url = base64.urlsafe_b64decode(encoded_url).decode()
+        if '.' not in token:
+            video_url = read_legacy_player_url(token)
+            if video_url is None:
+                return "Error: link expired or invalid", 404
+            return render_template('player.html', 
+                                 video_url=video_url, 
+                                 file_type=file_type,
+                                 render_url=RENDER_URL)
+        
+        link = read_player_token(token)
+        if link is None:
+            return "Error: link expired or invalid", 404
+        if not s3_client:
+            return "Error: storage unavailable", 503
+        
+        # Sign on each visit, so the stream URL lives exactly as long as the player link
+        key, expires = link
+        video_url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': WASABI_BUCKET, 'Key': key},
+            ExpiresIn=max(1, expires - int(time.time()))
+        )
         
         return render_template('player.html', 
                              video_url=video_url, 
@@ -947,7 +1210,9 @@ def health():
     return jsonify({"status": "healthy", "service": "wasabi_bot_player"})
 
 def run_flask():
-    web_app.run(host='0.0.0.0', port=8000, debug=False, threaded=True)
+    """Serve the player with waitress rather than the Werkzeug dev server."""
+    serve(web_app, host='0.0.0.0', port=8000, threads=8,
+          connection_limit=512, channel_timeout=30)
 
 # --- Main Function ---
 if __name__ == "__main__":